@@ -11,7 +11,7 @@ import deprecation
 
 # Project-related libraries
 import anhalyze.core
-from anhalyze.core import anhalyze_utils as au
+from anhalyze.core.DEPR import anhalyze_utils_depr as au
 from anhalyze.core.anhalyze_plot_utils import get_feature_mask, levels, cmap, vmin, vmax, line_levels
 
 
@@ -4,6 +4,9 @@
 # General libraries
 import datetime
 import os
+from collections import defaultdict
+from concurrent.futures import ProcessPoolExecutor
+from itertools import repeat
 
 import netCDF4 as nc
 import numpy as np
@@ -11,10 +14,10 @@ import pandas as pd
 import deprecation
 
 # project specific
-import anhalyze.core.anhalyze_plot_utils_depr
+import anhalyze.core.DEPR.anhalyze_plot_utils_depr
 from anhalyze.core import anhalyze_plot_utils as apu
-from anhalyze.core.anhalyze_utils import calc_stats_var_data, get_paths
-from anhalyze.core.anhalyze import get_date
+from anhalyze.core.DEPR.anhalyze_utils_depr import calc_stats_var_data, get_paths, reset_dataset_cache
+from anhalyze.core.anhalyze import get_date, get_year_month
 
 
 # Possible names AnhalyzeProject, AnhaProject, AnhalyzeTimeseries, AnhaTimeseries
@@ -84,6 +87,9 @@ class Anhalyze:
         self.one_per_month = one_per_month
         self.verbose = verbose
 
+        # Resolve data path once
+        self._data_path, _ = get_paths(self.run_name)
+
         # Init file list given conditions
         self.file_list = self.get_file_list(one_per_month=one_per_month, month_list=month_list)
 
@@ -112,42 +118,50 @@ class Anhalyze:
         """
 
         # Setup
-        selected_file_list = []
-        monthly_file_list = []
-        if month_list is None:
-            month_list = []
+        grid_stump = f'_grid{self.grid}'
+        years = [int(year) for year in self.years]
+        if month_list:
+            month_list = [int(month) for month in month_list]
 
         # Get paths
-        data_path, mask_path = get_paths(self.run_name)
+        data_path = self._data_path
+
+        # Stream grid files from path, without listing the whole directory first
+        with os.scandir(data_path) as entries:
+            grid_file_list = (entry.name for entry in entries if grid_stump in entry.name and entry.is_file())
 
-        # Get complete file list from path
-        file_list = os.listdir(data_path)
+            # Bucketing wanted grid files by (year, month) in a single pass over path,
+            # skipping years and months not selected before any sorting.
+            file_buckets = defaultdict(list)
+            for filename in grid_file_list:
+                # Skipping grid files without a date (e.g. mesh files), daily and monthly files are kept
+                year_month = get_year_month(filename)
+                if year_month is None:
+                    continue
+
+                year, month = year_month
+                if year in years and (not month_list or month in month_list):
+                    file_buckets[(year, month)].append(filename)
 
         # Selecting list of files given params
-        for year in self.years:
-            selected_file_list += (sorted([f for f in file_list if '_y' + year in f and '_grid' + self.grid in f]))
-
-        # Selecting first day on given month
-        if one_per_month:
-            if not month_list:
-                month_list = [get_date(filename, how='m') for filename in selected_file_list]
-
-            for year in self.years:
-                for month in month_list:
-                    file_name_stump = 'y{}m{}'.format(year, month)
-                    file_month_name = [f for f in selected_file_list if file_name_stump in f][0]
-                    monthly_file_list.append(file_month_name)
-        else:
-            # Make month selection
+        selected_file_list = []
+        for year in years:
+            # Use all months available for that year if not given
             if month_list:
-                for year in self.years:
-                    for month in month_list:
-                        file_name_stump = 'y{}m{}'.format(year, month)
-                        file_month_names = [f for f in selected_file_list if file_name_stump in f]
-                        monthly_file_list += file_month_names
+                year_month_list = month_list
+            else:
+                year_month_list = sorted(month for (y, month) in file_buckets if y == year)
 
-        if monthly_file_list:
-            selected_file_list = monthly_file_list
+            for month in year_month_list:
+                month_files = file_buckets.get((year, month))
+                if not month_files:
+                    continue
+
+                # Selecting first day on given month
+                if one_per_month:
+                    selected_file_list.append(min(month_files))
+                else:
+                    selected_file_list += sorted(month_files)
 
         # Adding full path to filenames
         selected_file_list = [data_path + filename for filename in selected_file_list]
@@ -155,40 +169,51 @@ class Anhalyze:
         return selected_file_list
 
 
-@deprecation.deprecated()
-def get_timeseries(file_list, lat_range, lon_range, depth=0, no_min_max=True, var='votemper'):
-    """    """
+def _process_file(filename, lat_range, lon_range, depth=0, no_min_max=True, var='votemper'):
+    """  Get date and var stats for a single file, used as get_timeseries worker. """
 
-    # Setting up
-    dates = []
-    var_means = var_stds = []
-    var_mins = var_maxs = []
-    var_min = var_max = None
+    # Get ANHA4 data and calculate var_data stats
+    with nc.Dataset(filename) as data:
+        var_stats = calc_stats_var_data(data, lat_range, lon_range, depth=depth,
+                                        no_min_max=no_min_max, var=var)
 
-    # Get datapoints by looping over files
-    for filename in file_list:
-        # Get ANHA4 data
-        data = nc.Dataset(filename)
+    # Save date from filename/time step
+    y, m, d = get_date(filename, how='ymd')
 
-        # Calculate var_data mean
-        if no_min_max:
-            var_mean, var_std = calc_stats_var_data(data, lat_range, lon_range, depth=depth,
-                                                    no_min_max=no_min_max, var=var)
-        else:
-            var_mean, var_std, var_min, var_max = calc_stats_var_data(data, lat_range, lon_range, depth=depth,
-                                                                      no_min_max=no_min_max, var=var)
+    return datetime.date(y, m, d), var_stats
 
-        # Save date from filename/time step
-        y, m, d = get_date(filename, how='ymd')
-        date = datetime.date(y, m, d)
 
-        # Append data to timeseries
-        var_means.append(var_mean)
-        var_stds.append(var_std)
-        dates.append(date)
-        if not no_min_max:
-            var_mins.append(var_min)
-            var_maxs.append(var_max)
+@deprecation.deprecated()
+def get_timeseries(file_list, lat_range, lon_range, depth=0, no_min_max=True, var='votemper', max_workers=1):
+    """  Get var stats timeseries from file list.
+         Files are processed serially by default. With max_workers > 1 they are split over worker processes,
+         since netCDF-C/HDF5 is not thread-safe. Each worker starts with an empty open-dataset cache,
+         so it opens its own netCDF handles instead of reusing ones inherited from this process.
+    """
+
+    # Setting up, preallocating one value per file
+    n_files = len(file_list)
+    dates = np.empty(n_files, dtype='datetime64[D]')
+    var_means = np.empty(n_files)
+    var_stds = np.empty(n_files)
+    if not no_min_max:
+        var_mins = np.empty(n_files)
+        var_maxs = np.empty(n_files)
+
+    # Get datapoints from files, results come back in file_list order
+    file_args = (file_list, repeat(lat_range), repeat(lon_range), repeat(depth), repeat(no_min_max), repeat(var))
+    if max_workers == 1:
+        results = list(map(_process_file, *file_args))
+    else:
+        with ProcessPoolExecutor(max_workers=max_workers, initializer=reset_dataset_cache) as executor:
+            results = list(executor.map(_process_file, *file_args))
+
+    for i, (date, var_stats) in enumerate(results):
+        dates[i] = date
+        if no_min_max:
+            var_means[i], var_stds[i] = var_stats
+        else:
+            var_means[i], var_stds[i], var_mins[i], var_maxs[i] = var_stats
 
     # Create timeseries df
     if no_min_max:
@@ -205,30 +230,56 @@ def get_timeseries(file_list, lat_range, lon_range, depth=0, no_min_max=True, va
     return timeseries_var
 
 
+def _group_wrap_day(timeseries, stat, q=None):
+    """  Group var_mean and var_std by wrap_day on NumPy arrays, skipping NaNs like pandas groupby.
+         The stat can be 'mean', 'max', or 'quantile' (with q).
+    """
+
+    # Empty timeseries give empty groups, as in pandas
+    keys = timeseries['wrap_day'].to_numpy()
+    if not len(keys):
+        return pd.DataFrame({'wrap_day': keys, 'var_mean': np.empty(0), 'var_std': np.empty(0)})
+
+    # Sorting wrap days, and finding where each group starts
+    order = np.argsort(keys, kind='stable')
+    keys = keys[order]
+    starts = np.concatenate([[0], np.flatnonzero(np.diff(keys)) + 1])
+
+    grouped = {'wrap_day': keys[starts]}
+    for column in ['var_mean', 'var_std']:
+        values = timeseries[column].to_numpy(dtype=float)[order]
+
+        if stat == 'mean':
+            valid = ~np.isnan(values)
+            with np.errstate(invalid='ignore'):
+                grouped[column] = (np.add.reduceat(np.where(valid, values, 0.), starts) /
+                                   np.add.reduceat(valid, starts))
+        elif stat == 'max':
+            grouped[column] = np.fmax.reduceat(values, starts)
+        else:
+            grouped[column] = np.array([np.nanquantile(group, q) for group in np.split(values, starts[1:])])
+
+    return pd.DataFrame(grouped)
+
+
 @deprecation.deprecated()
 def calc_timeseries(timeseries, action='g_mean', n_year=None):
     """  Generalized code that calculates one specific operation, depending on how it is called.
     """
 
-    # Making timeseries copy
-    timeseries = timeseries.copy()
-
     # Calculating full period climatology stats
     if 'g_' in action:
 
-        # Grouping timeseries
-        grouped_timeseries = timeseries.groupby('wrap_day')[['var_mean', 'var_std']]
-
         if 'mean' in action:
-            action_timeseries = grouped_timeseries.mean().reset_index()
+            action_timeseries = _group_wrap_day(timeseries, 'mean')
         elif 'quantile90' in action:
-            action_timeseries = grouped_timeseries.quantile(.9).reset_index()
+            action_timeseries = _group_wrap_day(timeseries, 'quantile', q=.9)
         elif 'quantile10' in action:
-            action_timeseries = grouped_timeseries.quantile(.1).reset_index()
+            action_timeseries = _group_wrap_day(timeseries, 'quantile', q=.1)
         elif 'median' in action:
-            action_timeseries = grouped_timeseries.median().reset_index()
+            action_timeseries = _group_wrap_day(timeseries, 'quantile', q=.5)
         elif 'max' in action:
-            action_timeseries = grouped_timeseries.max().reset_index()
+            action_timeseries = _group_wrap_day(timeseries, 'max')
         else:
             action_timeseries = None
 
@@ -237,7 +288,7 @@ def calc_timeseries(timeseries, action='g_mean', n_year=None):
 
         # Adding climatology stats to timeseries dataframe for easy comparison.
         if 'long' in action:
-            action_timeseries = np.array(timeseries['var_mean'].to_list() * n_year)
+            action_timeseries = np.tile(timeseries['var_mean'].to_numpy(), n_year)
 
         # Calculating MHW categories to timeseries dataframe.
         else:
@@ -277,7 +328,6 @@ def anhalize_timeseries(raw_timeseries, mhw=True):
     """
 
     # Set year vars
-    year_standard = 2000
     year_min = 1958
     year_max = 2009
     n_year = year_max - year_min + 1
@@ -287,29 +337,18 @@ def anhalize_timeseries(raw_timeseries, mhw=True):
     else:
         actions = ['g_quantile10', 'remove_2T', 'remove_3T', 'remove_4T']
 
-    # Make copy of raw data
-    anhalyzed_timeseries = raw_timeseries.copy()
-
-    # Change date formatting
-    anhalyzed_timeseries['date'] = pd.to_datetime(anhalyzed_timeseries['date'], format='%Y-%m-%d')
-
-    # Add Year column
-    anhalyzed_timeseries['year'] = anhalyzed_timeseries.date.dt.year
-
-    # Add Month column
-    anhalyzed_timeseries['month'] = anhalyzed_timeseries.date.dt.month
-
-    # Add day column
-    anhalyzed_timeseries['day'] = anhalyzed_timeseries.date.dt.day
-
     # Change date formatting
-    anhalyzed_timeseries['date2'] = anhalyzed_timeseries['date'].dt.date
-    anhalyzed_timeseries.drop('date', axis=1, inplace=True)
-    anhalyzed_timeseries.rename(columns={'date2': 'date'}, inplace=True)
-
-    # Add wrap-day column
-    anhalyzed_timeseries['wrap_day'] = anhalyzed_timeseries.apply(
-        lambda row: datetime.date(year_standard, row.month, row.day), axis=1)
+    dates = pd.to_datetime(raw_timeseries['date'], format='%Y-%m-%d')
+    months = dates.dt.month.astype(np.int8)
+    days = dates.dt.day.astype(np.int8)
+
+    # Make new dataframe from raw data, adding year, month, day
+    # and wrap-day, as integer month-day code (e.g. 229 for Feb 29) for fast grouping
+    anhalyzed_timeseries = raw_timeseries.assign(date=dates.dt.date,
+                                                 year=dates.dt.year.astype(np.int16),
+                                                 month=months,
+                                                 day=days,
+                                                 wrap_day=months.astype(np.int16) * 100 + days)
 
     # Folding data yearly to get day stats.
     timeseries_year_mean = calc_timeseries(anhalyzed_timeseries, action='g_mean')
@@ -337,7 +376,7 @@ def anhalize_timeseries(raw_timeseries, mhw=True):
 def plot_timeseries(timeseries_var, data_variables, lat_range, lon_range, var='votemper'):
     """  Wrapper to plot timeseries function  """
 
-    anhalyze.core.anhalyze_plot_utils_depr.plot_timeseries(timeseries_var, data_variables, lat_range, lon_range, var=var)
+    anhalyze.core.DEPR.anhalyze_plot_utils_depr.plot_timeseries(timeseries_var, data_variables, lat_range, lon_range, var=var)
 
 
 @deprecation.deprecated()
@@ -346,14 +385,14 @@ def show_var_data_maps(file_list, lat_range, lon_range, depth=0, var='votemper')
         Note: depth has not been tested.
     """
 
-    anhalyze.core.anhalyze_plot_utils_depr.show_var_data_maps(file_list, lat_range, lon_range, depth=depth, var=var)
+    anhalyze.core.DEPR.anhalyze_plot_utils_depr.show_var_data_maps(file_list, lat_range, lon_range, depth=depth, var=var)
 
 
 @deprecation.deprecated()
 def plot_mhw(anhalyzed_timeseries, year=1998, remove_mean=True, show_cat4=False, region="James Bay", mhw=True):
     """  Wrapper to plot mhw function  """
 
-    anhalyze.core.anhalyze_plot_utils_depr.plot_mhw(anhalyzed_timeseries, year=year, remove_mean=remove_mean, show_cat4=show_cat4, region=region, mhw=mhw)
+    anhalyze.core.DEPR.anhalyze_plot_utils_depr.plot_mhw(anhalyzed_timeseries, year=year, remove_mean=remove_mean, show_cat4=show_cat4, region=region, mhw=mhw)
 
 
 @deprecation.deprecated()
@@ -8,18 +8,84 @@ import netCDF4 as nc
 # Plotting-related libraries
 
 # OS-specific libraries
+import atexit
+import functools
 import os
 import socket
+import threading
+from collections import OrderedDict
 import deprecation
 
 # Project custom made libraries
 import anhalyze.core.anhalyze_plot_utils as apu
-from anhalyze.core.anhalyze_geo_depr import getIndex_sec
+from anhalyze.core.DEPR.anhalyze_geo_depr import getIndex_sec
+
+# Row-col ranges, keyed by (grid, shape, lat_range, lon_range). The model grid is static.
+_ROW_COL_RANGE_CACHE = {}
+
+# ANHA4 tmask per depth, keyed by (mask_path, depth). The mask is static.
+_MASK_CACHE = {}
+
+# Full nav lat-lon arrays, keyed by (grid, shape).
+_NAV_CACHE = {}
+
+
+class _OpenDatasetCache:
+    """ LRU cache of open netCDF datasets, closing the least recently used one when full. """
+
+    def __init__(self, maxsize=8):
+        self.maxsize = maxsize
+        self._datasets = OrderedDict()
+        self._lock = threading.Lock()
+
+    def open(self, path):
+        """ Return open dataset for path, opening it if not cached. """
+
+        with self._lock:
+            if path in self._datasets:
+                self._datasets.move_to_end(path)
+            else:
+                self._datasets[path] = nc.Dataset(path)
+
+                # Evict least recently used dataset
+                if len(self._datasets) > self.maxsize:
+                    _, dataset = self._datasets.popitem(last=False)
+                    dataset.close()
+
+            return self._datasets[path]
+
+    def close_all(self):
+        """ Close all cached datasets. """
+
+        with self._lock:
+            while self._datasets:
+                _, dataset = self._datasets.popitem()
+                dataset.close()
+
+
+# Open handles for files read repeatedly (mask files, first file of a list).
+_OPEN_DATASETS = _OpenDatasetCache()
+atexit.register(_OPEN_DATASETS.close_all)
+
+
+def _open(path):
+    """ Open netCDF dataset through the module LRU cache, caller should not close it. """
+    return _OPEN_DATASETS.open(path)
+
+
+def reset_dataset_cache():
+    """ Start a new, empty open-dataset cache in this process.
+        Used as worker initializer, so forked processes never reuse netCDF handles inherited from the parent.
+    """
+    global _OPEN_DATASETS
+    _OPEN_DATASETS = _OpenDatasetCache()
 
 
 @deprecation.deprecated()
+@functools.lru_cache(maxsize=8)
 def get_paths(run_name=None, environ_paths=False):
     """ Get paths to data and mask standard locations.
+        Paths are cached per (run_name, environ_paths), since they are resolved on every mask read.
 
     Parameters
     ----------
@@ -103,11 +169,8 @@ def get_mask(data, lat_range, lon_range, depth=0, cartesian=True):
     # Get paths
     data_path, mask_path = get_paths()
 
-    # Reading ANHA4 mask data
-    mask = nc.Dataset(mask_path + '/'+ "ANHA4_mask.nc")
-
-    # Extracting mask data for given depth
-    tmask = mask['tmask'][0][depth]
+    # Extracting ANHA4 mask data for given depth
+    tmask = _load_tmask(mask_path, depth)
 
     # Given data selection range in lat-lon or row-col
     if cartesian:
@@ -115,12 +178,23 @@ def get_mask(data, lat_range, lon_range, depth=0, cartesian=True):
     else:
         row_range, col_range = lat_range, lon_range
 
-    # Extracting mask data for given range
-    surf_mask = tmask[row_range[0]:row_range[1], col_range[0]:col_range[1]]
+    # Extracting mask data for given range, as a copy so callers can't modify the cached mask
+    surf_mask = tmask[row_range[0]:row_range[1], col_range[0]:col_range[1]].copy()
 
     return surf_mask
 
 
+def _load_tmask(mask_path, depth):
+    """  Read the ANHA4 tmask for given depth, only once per mask path and depth. """
+
+    key = (mask_path, depth)
+    if key not in _MASK_CACHE:
+        mask = _open(mask_path + '/' + "ANHA4_mask.nc")
+        _MASK_CACHE[key] = mask['tmask'][0, depth, :, :]
+
+    return _MASK_CACHE[key]
+
+
 @deprecation.deprecated()
 def get_var_data(data, lat_range, lon_range, depth=0, var='votemper', masked=True, cartesian=True):
     """  Getting Data Latitude and Longitude
@@ -129,52 +203,88 @@ def get_var_data(data, lat_range, lon_range, depth=0, var='votemper', masked=Tru
 
     """
 
-    # Get var data
-    var_data = data[var][:]
-
     # Given data selection range in lat-lon or row-col
     if cartesian:
         row_range, col_range = get_row_col_range(data, lat_range, lon_range)
     else:
         row_range, col_range = lat_range, lon_range
 
-    # Extracting data given lat-lon selection and depth
-    var_data = var_data[0, depth, row_range[0]:row_range[1], col_range[0]:col_range[1]]
+    # Reading only the var data within lat-lon selection and depth
+    var_data = data[var][0, depth, row_range[0]:row_range[1], col_range[0]:col_range[1]]
 
     if masked:
-        # Get mask
-        surf_mask = get_mask(data, lat_range, lon_range, depth=depth)
+        # Get mask, reusing the row-col range found above
+        surf_mask = get_mask(data, row_range, col_range, depth=depth, cartesian=False)
 
-        # Mask data
-        var_data.data[~np.ma.filled((1 == surf_mask.data))] = np.nan
+        # Mask data outside the ocean (land or undefined mask values)
+        var_data = np.ma.masked_where(np.ma.filled(surf_mask != 1, True), var_data, copy=False)
 
     return var_data
 
 
 @deprecation.deprecated()
 def get_row_col_range(data, lat_range, lon_range, grid='gridT'):
-    """ Get the row and col range given lat and lon range.  """
+    """ Get the row and col range given lat and lon range.
+        Ranges are cached per grid geometry, so the search runs once per region for all files.
+    """
+
+    # Compute range only once per grid and lat-lon selection
+    key = _get_nav_key(data, grid=grid) + (tuple(lat_range), tuple(lon_range))
+    if key not in _ROW_COL_RANGE_CACHE:
+        _ROW_COL_RANGE_CACHE[key] = _calc_row_col_range(data, lat_range, lon_range, grid=grid)
+
+    return _ROW_COL_RANGE_CACHE[key]
+
+
+def _get_nav_names(grid='gridT'):
+    """ Get nav lat-lon variable names for given grid. """
 
-    # Get all lat-lon data
     if grid == 'gridT':
-        lat = data['nav_lat_grid_T'][:]
-        lon = data['nav_lon_grid_T'][:]
+        return 'nav_lat_grid_T', 'nav_lon_grid_T'
     else:
-        # Get all lat-lon data
-        lat = data['nav_lat'][:]
-        lon = data['nav_lon'][:]
+        return 'nav_lat', 'nav_lon'
+
+
+def _get_nav_key(data, grid='gridT'):
+    """ Get grid geometry key (grid, shape).
+        Shape is read from metadata only, and keeps different configurations apart.
+    """
 
-    # Create mask given lat lon values.
-    lat_mask = np.ma.filled((lat.data > lat_range[0]) & (lat.data < lat_range[1]))
-    lon_mask = np.ma.filled((lon.data > lon_range[0]) & (lon.data < lon_range[1]))
+    lat_name, _ = _get_nav_names(grid)
 
-    # Apply masks to data
-    mask = lat
-    mask[~(lat_mask & lon_mask)] = 0
+    return grid, data[lat_name].shape
+
+
+def _get_nav_lat_lon(data, grid='gridT'):
+    """ Get full nav lat-lon arrays for given grid, cached per grid geometry. """
+
+    key = _get_nav_key(data, grid=grid)
+    if key not in _NAV_CACHE:
+        lat_name, lon_name = _get_nav_names(grid)
+        _NAV_CACHE[key] = (np.ma.getdata(data[lat_name][:]), np.ma.getdata(data[lon_name][:]))
+
+    return _NAV_CACHE[key]
+
+
+def _calc_row_col_range(data, lat_range, lon_range, grid='gridT'):
+    """ Compute the row and col range given lat and lon range.  """
+
+    # Get all lat-lon data, read only once per grid since the model geometry is time-invariant
+    lat, lon = _get_nav_lat_lon(data, grid=grid)
+
+    # Create mask given lat lon values, without writing into the lat-lon data.
+    # Comparisons are accumulated into two preallocated buffers instead of four temporaries.
+    combined = np.greater(lat, lat_range[0])
+    condition = np.less(lat, lat_range[1])
+    np.logical_and(combined, condition, out=combined)
+    np.greater(lon, lon_range[0], out=condition)
+    np.logical_and(combined, condition, out=combined)
+    np.less(lon, lon_range[1], out=condition)
+    np.logical_and(combined, condition, out=combined)
 
     # Find the row,col range by collapsing each axis.
-    row_ranges = np.where(mask.data.sum(axis=1) > 0)[0]
-    col_ranges = np.where(mask.data.sum(axis=0) > 0)[0]
+    row_ranges = np.flatnonzero(combined.any(axis=1))
+    col_ranges = np.flatnonzero(combined.any(axis=0))
 
     # Select range
     row_range = (row_ranges[0], row_ranges[-1])
@@ -201,7 +311,7 @@ def getMask_region(run,depth,row_range,col_range):
                 
     # Using the rows and cols indices to extract the mask
     # over the region of interest.
-    mask = nc.Dataset(mask_file)
+    mask = _open(mask_file)
     mask_region = mask['tmask'][:,:depth,row_range[0]:row_range[1],col_range[0]:col_range[1]]
         
     return mask_region[:].data
@@ -236,11 +346,11 @@ def getVar_region(run, grid, depth, lon_range,lat_range,var,years_list, month_li
     file_list = get_file_list(run=run, grid=grid, years_list=years_list, month_list=month_list, one_per_month=one_per_month, monthly_mean=monthly_mean)
     
     # Get depth levels
-    depth_levels = nc.Dataset(file_list[0])['deptht'][:depth]
+    depth_levels = _open(file_list[0])['deptht'][:depth]
     
     # Get latitude and longitude limits and indices
     if cardinal:
-        row_range, col_range = get_row_col_range(nc.Dataset(file_list[0]),grid, lat_range, lon_range)
+        row_range, col_range = get_row_col_range(_open(file_list[0]),grid, lat_range, lon_range)
     else:
         row_range, col_range = lat_range, lon_range
 
@@ -251,9 +361,9 @@ def getVar_region(run, grid, depth, lon_range,lat_range,var,years_list, month_li
     if grid == 'gridT':
         
         # Get latitude and longitude
-        lon = nc.Dataset(file_list[0])['nav_lon_grid_T'][row_range[0]:row_range[1],col_range[0]:col_range[1]]
+        lon = _open(file_list[0])['nav_lon_grid_T'][row_range[0]:row_range[1],col_range[0]:col_range[1]]
         lon[lon == 0] = np.nan
-        lat = nc.Dataset(file_list[0])['nav_lat_grid_T'][row_range[0]:row_range[1],col_range[0]:col_range[1]]
+        lat = _open(file_list[0])['nav_lat_grid_T'][row_range[0]:row_range[1],col_range[0]:col_range[1]]
         lat[lat == 0] = np.nan
         
         # Prealocating variable
@@ -277,9 +387,9 @@ def getVar_region(run, grid, depth, lon_range,lat_range,var,years_list, month_li
         var_region = np.empty([1, depth, np.size(lat,0),np.size(lon,1)])
         
         # Get latitude and longitude
-        lon = nc.Dataset(file_list[0])['nav_lon'][row_range[0]:row_range[1],col_range[0]:col_range[1]]
+        lon = _open(file_list[0])['nav_lon'][row_range[0]:row_range[1],col_range[0]:col_range[1]]
         lon[lon == 0] = np.nan
-        lat = nc.Dataset(file_list[0])['nav_lat'][row_range[0]:row_range[1],col_range[0]:col_range[1]]
+        lat = _open(file_list[0])['nav_lat'][row_range[0]:row_range[1],col_range[0]:col_range[1]]
         lat[lat == 0] = np.nan
         # Extracting data
         for filename in file_list:
@@ -293,9 +403,9 @@ def getVar_region(run, grid, depth, lon_range,lat_range,var,years_list, month_li
         
     else:
         # Get latitude and longitude
-        lon = nc.Dataset(file_list[0])['nav_lon'][row_range[0]:row_range[1],col_range[0]:col_range[1]]
+        lon = _open(file_list[0])['nav_lon'][row_range[0]:row_range[1],col_range[0]:col_range[1]]
         lon[lon == 0] = np.nan
-        lat = nc.Dataset(file_list[0])['nav_lat'][row_range[0]:row_range[1],col_range[0]:col_range[1]]
+        lat = _open(file_list[0])['nav_lat'][row_range[0]:row_range[1],col_range[0]:col_range[1]]
         lat[lat == 0] = np.nan
         
         # Prealocating variable
@@ -358,11 +468,11 @@ def getMask_sec(run,depth,sectName,i,j):
         
     if any([n in sectName for n in ["Davis","Lancaster","Jones","Bering"]]):
     
-        mask = nc.Dataset(mask_file)
+        mask = _open(mask_file)
         mask_sect = np.squeeze(mask['tmask'][:,:depth,i[0]:i[-1]+1,j[0]:j[-1]+1],axis=2)
                                               
     else:           
-        mask = nc.Dataset(mask_file)
+        mask = _open(mask_file)
         mask_sect = np.squeeze(mask['tmask'][:,:depth,i[0]:i[-1]+1,j[0]:j[-1]+1],axis=3)
         
     return mask_sect[:].data
@@ -407,14 +517,14 @@ def getVar_sec(run, sectName, grid, depth, var,years_list, month_list=None, one_
     file_list = get_file_list(run=run,grid=grid, years_list=years_list, month_list=month_list, one_per_month=one_per_month, monthly_mean=monthly_mean)
     
     # Get depth levels
-    depth_levels = nc.Dataset(file_list[0])['deptht'][:depth]
+    depth_levels = _open(file_list[0])['deptht'][:depth]
     
     # Get the Index from the transect tracer mask
     fileMask = mask_path+'ANHA4_trc_sec_mask_Nov2022.nc';
 
     if os.path.isfile(fileMask):
         # Get tmask data
-        mask = nc.Dataset(fileMask);
+        mask = _open(fileMask);
         tmask = mask['tmask'][:].data
     
         # Get the i's and j's indices
@@ -434,8 +544,8 @@ def getVar_sec(run, sectName, grid, depth, var,years_list, month_list=None, one_
         var_sec = np.empty([1, depth, len(i)])
         
         # Get latitude and longitude
-        lon = np.squeeze(nc.Dataset(file_list[0])['nav_lon_grid_T'][i[0]:i[-1]+1,j[0]:j[-1]+1])
-        lat = np.squeeze(nc.Dataset(file_list[0])['nav_lat_grid_T'][i[0]:i[-1]+1,j[0]:j[-1]+1])
+        lon = np.squeeze(_open(file_list[0])['nav_lon_grid_T'][i[0]:i[-1]+1,j[0]:j[-1]+1])
+        lat = np.squeeze(_open(file_list[0])['nav_lat_grid_T'][i[0]:i[-1]+1,j[0]:j[-1]+1])
         
         # Extracting data
         if any([n in sectName for n in ["Davis","Lancaster","Jones","Bering"]]):
@@ -463,8 +573,8 @@ def getVar_sec(run, sectName, grid, depth, var,years_list, month_list=None, one_
         var_sec = np.empty([1, depth, len(i), 2])
         
         # Get latitude and longitude
-        lon = nc.Dataset(file_list[0])['nav_lon'][i[0]:i[-1]+1,j[0]:j[-1]+1]
-        lat = nc.Dataset(file_list[0])['nav_lat'][i[0]:i[-1]+1,j[0]:j[-1]+1]
+        lon = _open(file_list[0])['nav_lon'][i[0]:i[-1]+1,j[0]:j[-1]+1]
+        lat = _open(file_list[0])['nav_lat'][i[0]:i[-1]+1,j[0]:j[-1]+1]
         
         # Extracting data
         for filename in file_list:
@@ -482,8 +592,8 @@ def getVar_sec(run, sectName, grid, depth, var,years_list, month_list=None, one_
         var_sec = np.empty([1, depth, 2, len(i)])
         
         # Get latitude and longitude
-        lon = nc.Dataset(file_list[0])['nav_lon'][i[0]:i[-1]+1,j[0]:j[-1]+1]
-        lat = nc.Dataset(file_list[0])['nav_lat'][i[0]:i[-1]+1,j[0]:j[-1]+1]
+        lon = _open(file_list[0])['nav_lon'][i[0]:i[-1]+1,j[0]:j[-1]+1]
+        lat = _open(file_list[0])['nav_lat'][i[0]:i[-1]+1,j[0]:j[-1]+1]
         
         # Extracting data
         for filename in file_list:
@@ -572,20 +682,29 @@ def show_var_data_map(data, lat_range, lon_range, depth=0, var='votemper'):
 def calc_stats_var_data(data, lat_range, lon_range, depth=0, no_min_max=True, var='votemper'):
     """  """
 
+    # Get row-col range once, shared by the var data and its mask
+    row_range, col_range = get_row_col_range(data, lat_range, lon_range)
+
     # Get var data
-    var_data = get_var_data(data, lat_range, lon_range, depth=depth, var=var)
+    var_data = get_var_data(data, row_range, col_range, depth=depth, var=var, cartesian=False)
 
-    # Calculating stats
-    var_mean = np.nanmean(var_data)
-    var_std = np.nanstd(var_data)
+    # Calculating stats, masked values are skipped.
+    # Std reuses the mean, instead of having std() compute it again.
+    var_mean = var_data.mean()
+    var_std = np.ma.sqrt(((var_data - var_mean) ** 2).mean())
 
     if no_min_max:
-        return var_mean, var_std
+        return _stat_to_float(var_mean), _stat_to_float(var_std)
 
     else:
-        var_min = np.nanmin(var_data)
-        var_max = np.nanmax(var_data)
+        var_min = var_data.min()
+        var_max = var_data.max()
+
+        return _stat_to_float(var_mean), _stat_to_float(var_std), _stat_to_float(var_min), _stat_to_float(var_max)
+
 
-        return var_mean, var_std, var_min, var_max
+def _stat_to_float(stat):
+    """  Convert masked-array stat to float, nan when the whole region is masked (e.g. only land). """
+    return float(np.ma.filled(stat, np.nan))
 
 
@@ -3,6 +3,7 @@
 
 # System-related libraries
 import os
+import re
 import numpy as np
 
 # Data-related libraries
@@ -11,6 +12,13 @@ import xarray as xr
 # Project-related libraries
 
 
+# Date in filename, e.g. '_y1998m04d05_' for ANHA4-EPM111_y1998m04d05_gridB.nc
+_DATE_RE = re.compile(r'_(y(\d{4})m(\d{2})d(\d{2}))_')
+
+# Year and month in filename, day optional, e.g. '_y1998m04d05_' or '_y1998m04_'
+_YEAR_MONTH_RE = re.compile(r'_y(\d{4})m(\d{2})(?:d\d{2})?_')
+
+
 # Possible other names AnhaModelData, Dataset, AnhaData, AnhaDataframe, AnhaReader, AnhaGrid
 class AnhaDataset:
     """ Wrapper :py:class: for `xarray.Dataset` with specific implementation
@@ -508,14 +516,33 @@ def get_date(filename, how=''):
     """
 
     # Get full date from filename
-    date = filename.split('_')[-2]
+    date_match = _DATE_RE.search(filename)
+    if date_match:
+        date, year, month, day = date_match.groups()
+    else:
+        # Fall back to the underscore-separated token for other filename formats
+        date = filename.split('_')[-2]
+        year, month, day = date[1:5], date[6:8], date[9:11]
 
     # Return format specific date info
     if how == 'ymd':
-        return int(date[1:5]), int(date[6:8]), int(date[9:11])
+        return int(year), int(month), int(day)
     elif how == 'y':
-        return int(date[1:5])
+        return int(year)
     elif how == 'm':
-        return int(date[6:8])
+        return int(month)
     else:
         return date
+
+
+def get_year_month(filename):
+    """  Get year and month from filename, as integers.
+         Accepts daily (*/*/ANHA4-EPM111_y1998m04d05_gridB.nc) and monthly (*/*/ANHA4-EPM111_y1998m04_gridB.nc)
+         filenames. Returns None if filename has no date (e.g. mesh files).
+    """
+
+    year_month_match = _YEAR_MONTH_RE.search(filename)
+    if not year_month_match:
+        return None
+
+    return int(year_month_match.group(1)), int(year_month_match.group(2))
@@ -0,0 +1,77 @@
+# Library imports
+import os
+
+import pytest
+
+# Project-related libraries
+import anhalyze.core.DEPR.anhalyze_timeseries_depr as atd
+
+
+FILENAMES = ['ANHA4-EPM111_y1998m01d05_gridT.nc',
+             'ANHA4-EPM111_y1998m01d10_gridT.nc',
+             'ANHA4-EPM111_y1998m02d05_gridT.nc',
+             'ANHA4-EPM111_y1998m03_gridT.nc',
+             'ANHA4-EPM111_y1999m01d05_gridT.nc',
+             'ANHA4-EPM111_y1998m01d05_gridU.nc',
+             'ANHA4-EPM111_mesh_gridT.nc']
+
+
+@pytest.fixture
+def data_path(tmp_path, monkeypatch):
+    """ Directory with daily, monthly and undated grid files, used as data path. """
+
+    for filename in FILENAMES:
+        (tmp_path / filename).touch()
+
+    data_path = str(tmp_path) + '/'
+    monkeypatch.setattr(atd, 'get_paths', lambda run_name=None: (data_path, ''))
+
+    return data_path
+
+
+def get_file_names(**kwargs):
+    """ File names selected by Anhalyze for given params. """
+    file_list = atd.Anhalyze(verbose=False, **kwargs).file_list
+    return [os.path.basename(filename) for filename in file_list]
+
+
+def test_all_months(data_path):
+    """ Daily and monthly files of year are listed in order, undated and other grid files are skipped. """
+
+    file_list = atd.Anhalyze(years=['1998'], verbose=False).file_list
+
+    assert file_list == [data_path + filename for filename in ['ANHA4-EPM111_y1998m01d05_gridT.nc',
+                                                               'ANHA4-EPM111_y1998m01d10_gridT.nc',
+                                                               'ANHA4-EPM111_y1998m02d05_gridT.nc',
+                                                               'ANHA4-EPM111_y1998m03_gridT.nc']]
+
+
+def test_years(data_path):
+    """ Years are listed in given order. """
+
+    assert get_file_names(years=['1999', '1998'])[:2] == ['ANHA4-EPM111_y1999m01d05_gridT.nc',
+                                                          'ANHA4-EPM111_y1998m01d05_gridT.nc']
+
+
+def test_month_list(data_path):
+    """ Only given months, with string or int months. """
+
+    expected = ['ANHA4-EPM111_y1998m01d05_gridT.nc', 'ANHA4-EPM111_y1998m01d10_gridT.nc']
+
+    assert get_file_names(years=['1998'], month_list=['01']) == expected
+    assert get_file_names(years=['1998'], month_list=[1]) == expected
+
+
+def test_one_per_month(data_path):
+    """ First file of each month. """
+
+    assert get_file_names(years=['1998'], one_per_month=True) == ['ANHA4-EPM111_y1998m01d05_gridT.nc',
+                                                                  'ANHA4-EPM111_y1998m02d05_gridT.nc',
+                                                                  'ANHA4-EPM111_y1998m03_gridT.nc']
+
+
+def test_missing_month(data_path):
+    """ Months without files are skipped. """
+
+    assert get_file_names(years=['1998'], month_list=['03', '04'], one_per_month=True) == \
+        ['ANHA4-EPM111_y1998m03_gridT.nc']
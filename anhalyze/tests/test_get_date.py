@@ -0,0 +1,55 @@
+# Library imports
+import unittest
+
+# Project-related libraries
+from anhalyze.core.anhalyze import get_date, get_year_month
+
+
+class GetDateTestCase(unittest.TestCase):
+    """ Testing date parsing from ANHA filenames. """
+
+    filename = '/root_path/NEMO/ANHA4/ANHA4-EPM111_y1998m04d05_gridT.nc'
+
+    def test_ymd(self):
+        """ Year, month and day as integers. """
+        self.assertEqual(get_date(self.filename, how='ymd'), (1998, 4, 5))
+
+    def test_year(self):
+        """ Year as integer. """
+        self.assertEqual(get_date(self.filename, how='y'), 1998)
+
+    def test_month(self):
+        """ Month as integer. """
+        self.assertEqual(get_date(self.filename, how='m'), 4)
+
+    def test_default(self):
+        """ Full date token from filename. """
+        self.assertEqual(get_date(self.filename), 'y1998m04d05')
+
+    def test_without_day(self):
+        """ Filenames without day still return the date token. """
+        filename = '/root_path/NEMO/ANHA4/ANHA4-EPM111_y1998m04_gridT.nc'
+        self.assertEqual(get_date(filename), 'y1998m04')
+        self.assertEqual(get_date(filename, how='y'), 1998)
+        self.assertEqual(get_date(filename, how='m'), 4)
+
+
+
+class GetYearMonthTestCase(unittest.TestCase):
+    """ Testing year and month parsing from ANHA filenames. """
+
+    def test_daily(self):
+        """ Daily filenames. """
+        self.assertEqual(get_year_month('/root_path/ANHA4-EPM111_y1998m04d05_gridT.nc'), (1998, 4))
+
+    def test_monthly(self):
+        """ Monthly filenames, without day. """
+        self.assertEqual(get_year_month('/root_path/ANHA4-EPM111_y1998m04_gridT.nc'), (1998, 4))
+
+    def test_undated(self):
+        """ Filenames without date return None. """
+        self.assertIsNone(get_year_month('/root_path/ANHA4-EPM111_mesh_gridT.nc'))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,56 @@
+# Library imports
+import unittest
+
+import numpy as np
+import pandas as pd
+
+# Project-related libraries
+from anhalyze.core.DEPR.anhalyze_timeseries_depr import calc_timeseries
+
+
+class CalcTimeseriesTestCase(unittest.TestCase):
+    """ Testing wrap-day climatology stats against pandas groupby. """
+
+    def setUp(self):
+        """ Random timeseries over a few wrap days, with NaNs. """
+
+        rng = np.random.default_rng(0)
+        n_rows = 500
+        self.timeseries = pd.DataFrame({'wrap_day': rng.choice([105, 229, 601, 1231], n_rows).astype(np.int16),
+                                        'var_mean': rng.random(n_rows),
+                                        'var_std': rng.random(n_rows)})
+        self.timeseries.loc[::7, 'var_mean'] = np.nan
+        self.timeseries.loc[::11, 'var_std'] = np.nan
+
+    def assert_grouped_equal(self, action, expected):
+        """ Compare calc_timeseries output with expected pandas groupby output. """
+
+        result = calc_timeseries(self.timeseries, action=action)
+        expected = expected.reset_index()
+
+        np.testing.assert_array_equal(result['wrap_day'].to_numpy(), expected['wrap_day'].to_numpy())
+        np.testing.assert_allclose(result[['var_mean', 'var_std']].to_numpy(),
+                                   expected[['var_mean', 'var_std']].to_numpy())
+
+    def test_g_stats(self):
+        """ Mean, max, median and quantiles match pandas, skipping NaNs. """
+
+        grouped = self.timeseries.groupby('wrap_day')[['var_mean', 'var_std']]
+
+        self.assert_grouped_equal('g_mean', grouped.mean())
+        self.assert_grouped_equal('g_max', grouped.max())
+        self.assert_grouped_equal('g_median', grouped.median())
+        self.assert_grouped_equal('g_quantile90', grouped.quantile(.9))
+        self.assert_grouped_equal('g_quantile10', grouped.quantile(.1))
+
+    def test_g_stats_empty(self):
+        """ Empty timeseries return an empty wrap_day, var_mean, var_std frame. """
+
+        result = calc_timeseries(self.timeseries.iloc[:0], action='g_mean')
+
+        self.assertTrue(result.empty)
+        self.assertEqual(list(result.columns), ['wrap_day', 'var_mean', 'var_std'])
+
+
+if __name__ == '__main__':
+    unittest.main()